@@ -116,6 +116,36 @@ def dc2xml():
     
     helpers.save_xml(res_dict, args['<output>'])
 
+def dcdiff():
+    """dcdiff:
+    Compares works in two environments and outputs only the works that were added, 
+    removed or changed, one row per changed field. Both environments are streamed 
+    sorted by id so a full repository comparison is done in one pass.
+
+    USAGE:
+    dcdiff [-q <query> -f <fields> -o <old_env> -n <new_env>] <output>
+
+    OPTIONS:
+    -q <query>, --query <query>       Query string style query [default: *]
+    -f <fields>, --fields <fields>    comma separated [default: id,descriptiveMetadata.title,ark,collection,descriptiveMetadata.subject.displayFacet]
+    -o <old_env>, --old <old_env>     environment to compare from [default: staging]
+    -n <new_env>, --new <new_env>     environment to compare to [default: production]
+    -h, --help                        display this help
+
+    EXAMPLES:
+    Compare a collection in staging and production
+    $ dcdiff -q 'collection.id:1c2e2200-c12d-4c7f-8b87-a935c349898a' ~/diff.csv
+    """
+
+    args = docopt(dcdiff.__doc__, version='.1')
+    fields = args['--fields'].split(',')
+    query = helpers.query_for_query_string('work', args['--query'])
+    old_results = helpers.get_search_results(args['--old'], query, sort='id')
+    new_results = helpers.get_search_results(args['--new'], query, sort='id')
+    diffs = helpers.diff_results(old_results, new_results, fields)
+    headers = ['id', 'status', 'field', args['--old'], args['--new']]
+    helpers.save_as_csv(headers, helpers.get_diff_as_list(diffs), args['<output>'])
+
 if __name__ == '__main__':
     dc2csv()
 
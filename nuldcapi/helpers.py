@@ -2,6 +2,7 @@ from nuldcapi import terms
 import elasticsearch
 from elasticsearch import helpers
 import unicodecsv as csv
+import hashlib
 
 def format_raw(field, source_dict): 
     """get raw field and stringify"""
@@ -69,9 +70,10 @@ def flatten_metadata(source_dict, field):
     flatten_to_list = lambda l: sum(map(flatten_to_list,l),[]) if isinstance(l,list) else [str(l)]    
     return ' | '.join(flatten_to_list(field_metadata)) 
 
-def get_search_results(environment, query):
+def get_search_results(environment, query, sort=None):
     """Takes an environment and a query and returns an iterable of all results
     using the 'scan' function in es.helpers. Scan is an efficient pager.
+    Pass a field as sort (e.g. 'id') to get the results back in that order. 
     """
 
     # pick an environment 
@@ -82,6 +84,10 @@ def get_search_results(environment, query):
     es = elasticsearch.Elasticsearch(proxy[environment], send_get_body_as='POST', timeout=30, max_retries=10, retry_on_timeout=True)
     # return the results 
     # return es.search(index='meadow', body={"query":query})
+    if sort:
+        # copy so we don't clobber the caller's query, scan needs preserve_order to keep the sort
+        query = dict(query, sort=[{sort: 'asc'}])
+        return helpers.scan(es, query=query, index='meadow', size=100, preserve_order=True)
     return helpers.scan(es, query=query, index='meadow', size=100)
     
 def get_all_fields_from_set(search_results):
@@ -117,6 +123,75 @@ def get_results_as_list(search_results, fields):
         work_metadata = work.get('_source')
         yield [flatten_metadata(work_metadata, field) for field in fields]
 
+def hash_fields(values):
+    """Takes a list of flattened field values and returns a short hash of them. 
+    Used to cheaply check whether two versions of a work differ.
+
+    ## Example
+    >>> hash_fields(['1', 'title']) == hash_fields(['1', 'title'])
+    True
+    >>> hash_fields(['1', 'title']) == hash_fields(['1title', ''])
+    False
+    """
+
+    # join on a unit separator so ['a','bc'] and ['ab','c'] don't collide
+    return hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+
+def diff_results(old_results, new_results, fields, key='id'):
+    """Merge-joins two iterables of search results that are sorted by key and 
+    yields (key, status, changes) for every work that was added, removed or changed. 
+    changes is a list of (field, old_value, new_value). Only one work from each side 
+    is held in memory at a time so it works on a full repository.
+
+    ## Example
+    >>> old = [{'_source': {'id':'a', 'title':'A'}}, {'_source': {'id':'b', 'title':'B'}},
+    ...    {'_source': {'id':'c', 'title':'C'}}]
+    >>> new = [{'_source': {'id':'b', 'title':'B'}}, {'_source': {'id':'c', 'title':'See'}},
+    ...    {'_source': {'id':'d', 'title':'D'}}]
+    >>> for diff in diff_results(old, new, ['id', 'title']):
+    ...     print(diff)
+    ('a', 'removed', [('id', 'a', ''), ('title', 'A', '')])
+    ('c', 'changed', [('title', 'C', 'See')])
+    ('d', 'added', [('id', '', 'd'), ('title', '', 'D')])
+    """
+
+    # make sure the key comes along so we can join on it
+    if key not in fields:
+        fields = [key] + fields
+    key_index = fields.index(key)
+    old_rows = get_results_as_list(old_results, fields)
+    new_rows = get_results_as_list(new_results, fields)
+    old_row = next(old_rows, None)
+    new_row = next(new_rows, None)
+
+    while old_row is not None or new_row is not None:
+        if new_row is None or (old_row is not None and old_row[key_index] < new_row[key_index]):
+            yield (old_row[key_index], 'removed', [(f, o, '') for f, o in zip(fields, old_row)])
+            old_row = next(old_rows, None)
+        elif old_row is None or new_row[key_index] < old_row[key_index]:
+            yield (new_row[key_index], 'added', [(f, '', n) for f, n in zip(fields, new_row)])
+            new_row = next(new_rows, None)
+        else:
+            # same work on both sides, only look at fields if the hashes differ
+            if hash_fields(old_row) != hash_fields(new_row):
+                changes = [(f, o, n) for f, o, n in zip(fields, old_row, new_row) if o != n]
+                yield (old_row[key_index], 'changed', changes)
+            old_row = next(old_rows, None)
+            new_row = next(new_rows, None)
+
+def get_diff_as_list(diffs):
+    """Flattens the output of diff_results to one row per changed field so it can 
+    be passed to save_as_csv
+
+    ## Example
+    >>> list(get_diff_as_list([('c', 'changed', [('title', 'C', 'See')])]))
+    [['c', 'changed', 'title', 'C', 'See']]
+    """
+
+    for work_id, status, changes in diffs:
+        for field, old_value, new_value in changes:
+            yield [work_id, status, field, old_value, new_value]
+
 def query_for_query_string(model, match):
     """ Uses teh query string query to return results. Examples on the elasticsearch
     site <https://www.elastic.co/guide/en/elasticsearch/reference/current/query-dsl-query-string-query.html>